@@ -1,18 +1,88 @@
-from fastapi import FastAPI, HTTPException, Header
-from pydantic import BaseModel
-import requests
+from fastapi import FastAPI, HTTPException, Header, Request, Query
+from pydantic import BaseModel, ConfigDict
+from contextlib import asynccontextmanager
+import asyncio
+import httpx
+import base64
 import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from firebase_admin import firestore, auth
+from firebase_client import db, run_in_fs_pool, fetch_page
 from typing import Optional
 import os
 import uvicorn
 from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
+import json
+import logging
+import hashlib
+import threading
+import time
+from cachetools import TTLCache
 from datetime import timezone
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# How often the ID token public keys are refreshed in the background (seconds)
+KEY_REFRESH_INTERVAL = 300
+
+# Helper function to base64url-encode a JWT segment without padding
+def b64url_encode(data: bytes):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+# Helper function to build an unsigned token that passes the Admin SDK's pre-checks,
+# so verifying it makes the SDK fetch and cache Google's public keys
+def build_warmup_token():
+    project_id = firebase_admin.get_app().project_id
+    now = int(time.time())
+    header = {"alg": "RS256", "kid": "warmup", "typ": "JWT"}
+    payload = {
+        "aud": project_id,
+        "iss": f"https://securetoken.google.com/{project_id}",
+        "sub": "warmup",
+        "iat": now,
+        "exp": now + 3600,
+    }
+    return ".".join([
+        b64url_encode(json.dumps(header).encode()),
+        b64url_encode(json.dumps(payload).encode()),
+        b64url_encode(b"warmup"),
+    ])
+
+# Background task keeping the Admin SDK's public key cache warm, so token
+# verification on the request path never waits on a key fetch
+async def refresh_public_keys():
+    while True:
+        try:
+            await run_in_fs_pool(auth.verify_id_token, build_warmup_token())
+        except auth.CertificateFetchError as e:
+            logger.warning("Refreshing ID token public keys failed, retrying in %ss: %s", KEY_REFRESH_INTERVAL, e)
+        except auth.InvalidIdTokenError as e:
+            # Expected: the keys were fetched and have no entry for the warm-up key id.
+            # Any other rejection means the token failed the pre-checks before any fetch
+            if "key id" not in str(e):
+                logger.warning("ID token key warm-up rejected before fetching keys: %s", e)
+        except Exception:
+            logger.exception("Unexpected error while refreshing ID token public keys")
+        await asyncio.sleep(KEY_REFRESH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared HTTP client so Identity Toolkit calls reuse keep-alive connections
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        timeout=10,
+    )
+    key_refresh = asyncio.create_task(refresh_public_keys())
+    yield
+    key_refresh.cancel()
+    await app.state.http.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 API_KEY = os.getenv("FIREBASE_WEB_API_KEY")
 
@@ -25,21 +95,57 @@ app.add_middleware(
 )
 
 
-cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH"))
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Decoded ID tokens keyed by token hash, so repeat requests skip JWT signature verification.
+# Callers of this cache never checked revocation, so a revoked token stays valid here until exp
+token_cache = TTLCache(maxsize=10000, ttl=3600)
+# Tokens that also passed the revocation check. The caches are per worker process, so a
+# logout only evicts in the worker that served it; other workers may accept the revoked
+# token until this TTL runs out, which bounds that window
+revocation_cache = TTLCache(maxsize=10000, ttl=60)
+token_cache_lock = threading.Lock()
+
+# Helper function to verify a Firebase ID token, reusing earlier results until the token expires
+def cached_verify_id_token(token: str, check_revoked: bool = False):
+    # Missing or non-string tokens are left to the Admin SDK, which rejects them with its own error
+    if not isinstance(token, str) or not token:
+        return auth.verify_id_token(token, check_revoked=check_revoked)
+    key = hashlib.sha256(token.encode()).digest()
+    cache = revocation_cache if check_revoked else token_cache
+    with token_cache_lock:
+        decoded_token = cache.get(key)
+    if decoded_token is not None and decoded_token["exp"] > time.time():
+        return decoded_token
+
+    decoded_token = auth.verify_id_token(token, check_revoked=check_revoked)
+    with token_cache_lock:
+        token_cache[key] = decoded_token
+        if check_revoked:
+            revocation_cache[key] = decoded_token
+    return decoded_token
+
+# Helper function to drop cached tokens of a user whose tokens have been revoked
+# (in this worker process only; see revocation_cache)
+def evict_cached_tokens(uid: str):
+    with token_cache_lock:
+        for cache in (token_cache, revocation_cache):
+            for key in [key for key, decoded in cache.items() if decoded["uid"] == uid]:
+                cache.pop(key, None)
 
 class UserSignUp(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     email: str
     password: str
 
 class UserSignIn(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     email: str
     password: str
 
 
 @app.post("/signup")
-def sign_up(user: UserSignUp):
+async def sign_up(user: UserSignUp, request: Request):
     # Firebase sign-up endpoint
     sign_up_url = f'https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={API_KEY}'
     sign_up_payload = {
@@ -47,7 +153,7 @@ def sign_up(user: UserSignUp):
         "password": user.password,
         "returnSecureToken": True
     }
-    sign_up_response = requests.post(sign_up_url, json=sign_up_payload)
+    sign_up_response = await request.app.state.http.post(sign_up_url, json=sign_up_payload)
     
     if sign_up_response.status_code == 200:
         id_token = sign_up_response.json().get('idToken')
@@ -58,7 +164,7 @@ def sign_up(user: UserSignUp):
             "requestType": "VERIFY_EMAIL",
             "idToken": id_token
         }
-        verify_email_response = requests.post(verify_email_url, json=verify_email_payload)
+        verify_email_response = await request.app.state.http.post(verify_email_url, json=verify_email_payload)
         
         if verify_email_response.status_code == 200:
             return {"message": "Verification email sent. Please check your inbox."}
@@ -70,20 +176,22 @@ def sign_up(user: UserSignUp):
 
     
 @app.post("/signin")
-def sign_in(user: UserSignIn):
+async def sign_in(user: UserSignIn, request: Request):
     url = f'https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={API_KEY}'
     payload = {
         "email": user.email,
         "password": user.password,
         "returnSecureToken": True
     }
-    response = requests.post(url, json=payload)
+    response = await request.app.state.http.post(url, json=payload)
     if response.status_code == 200:
         return response.json()
     else:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     
 class UserProfile(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     name: str
     city: str
     country: str
@@ -95,34 +203,61 @@ class UserProfile(BaseModel):
 
 
 class PasswordResetRequest(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     email: str
 
 @app.post("/password-reset")
-def send_password_reset_email(request: PasswordResetRequest):
+async def send_password_reset_email(reset: PasswordResetRequest, request: Request):
     url = f'https://identitytoolkit.googleapis.com/v1/accounts:sendOobCode?key={API_KEY}'
     payload = {
         "requestType": "PASSWORD_RESET",
-        "email": request.email
+        "email": reset.email
     }
-    response = requests.post(url, json=payload)
+    response = await request.app.state.http.post(url, json=payload)
     if response.status_code == 200:
         return {"message": "Password reset email sent."}
     else:
         raise HTTPException(status_code=response.status_code, detail=response.json())
     
 
+# Static and derived recruiter fields, written only when the document lacks them
+PROFILE_DEFAULTS = {
+    "connects": 100, # Default 100 connects
+    "rating": 0.0,  # Default rating
+    "no_of_people_rated": 0,  # Initially 0
+    "verified_badge": False,  # Recruiters need to purchase verification
+    "num_candidates_listed": 0,  # Updated dynamically as they list candidates
+    "created_at": firestore.SERVER_TIMESTAMP,  # Server timestamp at creation
+    "num_of_deals": 0,  # Starts at 0
+    "tags": [],  # Derived from roles of listed candidates
+    "sponsored": {"status": False, "created_at": None, "plan_name": None, "end_date": None},
+    "highlighted": False  # Default false
+}
+
+# Helper function to create or update a recruiter profile; defaults only fill missing
+# fields, so re-posting a profile never resets connects or num_candidates_listed
+@firestore.transactional
+def save_profile(transaction, user_ref, profile_data):
+    snapshot = user_ref.get(transaction=transaction)
+    existing = snapshot.to_dict() if snapshot.exists else {}
+    user_data = {field: value for field, value in PROFILE_DEFAULTS.items() if field not in existing}
+    user_data.update(profile_data)
+    transaction.set(user_ref, user_data, merge=True)
+
+
 @app.post("/user/profile")
-def create_user_profile(profile: UserProfile, token: str):
+async def create_user_profile(profile: UserProfile, token: str):
     try:
         # Verify Firebase ID token
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await run_in_fs_pool(cached_verify_id_token, token)
         uid = decoded_token["uid"]
 
         # Reference Firestore document
         user_ref = db.collection("recruiters").document(uid)
 
-        # Data to be stored (including static and derived fields)
-        user_data = {
+        # Profile fields supplied by the user
+        profile_data = {
             "name": profile.name,
             "city": profile.city,
             "country": profile.country,
@@ -131,21 +266,11 @@ def create_user_profile(profile: UserProfile, token: str):
             "bio": profile.bio,
             "role": profile.role,
             "profile_pic_url": profile.profile_pic_url,
-            "connects": 100, # Default 100 connects
-            "rating": 0.0,  # Default rating
-            "no_of_people_rated": 0,  # Initially 0
-            "verified_badge": False,  # Recruiters need to purchase verification
-            "num_candidates_listed": 0,  # Updated dynamically as they list candidates
-            "created_at": datetime.utcnow(),  # Timestamp at creation
-            "updated_at": datetime.utcnow(),  # Timestamp at update
-            "num_of_deals": 0,  # Starts at 0
-            "tags": [],  # Derived from roles of listed candidates
-            "sponsored": {"status": False, "created_at": None, "plan_name": None, "end_date": None},
-            "highlighted": False  # Default false
+            "updated_at": firestore.SERVER_TIMESTAMP,  # Server timestamp at update
         }
 
-        # Save user profile in Firestore
-        user_ref.set(user_data)
+        # Save user profile in Firestore without resetting existing counters
+        await run_in_fs_pool(save_profile, db.transaction(), user_ref, profile_data)
 
         return {"message": "User profile created/updated successfully."}
 
@@ -153,14 +278,15 @@ def create_user_profile(profile: UserProfile, token: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/logout")
-def logout(token: str):
+async def logout(token: str):
     try:
         # Verify the ID token and get the user UID
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await run_in_fs_pool(cached_verify_id_token, token)
         uid = decoded_token["uid"]
 
         # Revoke all refresh tokens for the user
-        auth.revoke_refresh_tokens(uid)
+        await run_in_fs_pool(auth.revoke_refresh_tokens, uid)
+        evict_cached_tokens(uid)
 
         return {"message": "User logged out successfully."}
 
@@ -169,17 +295,17 @@ def logout(token: str):
 
 
 @app.post("/verify-token")
-def verify_token(token: str = Header(None)):
+async def verify_token(token: str = Header(None)):
     try:
         # Decode and verify the Firebase ID token (disable IAM check)
-        decoded_token = auth.verify_id_token(token, check_revoked=True)
+        decoded_token = await run_in_fs_pool(cached_verify_id_token, token, check_revoked=True)
         uid = decoded_token["uid"]
 
         return {
             "message": "Token is valid.",
             "user_id": uid,
             "email": decoded_token.get("email"),
-            "expires_at": datetime.utcfromtimestamp(decoded_token["exp"]).strftime("%Y-%m-%d %H:%M:%S UTC")
+            "expires_at": datetime.fromtimestamp(decoded_token["exp"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
         }
 
     except auth.ExpiredIdTokenError:
@@ -191,21 +317,19 @@ def verify_token(token: str = Header(None)):
 
 
 @app.get("/users")
-def get_all_users():
+def get_all_users(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
     try:
-        users_ref = db.collection("recruiters").stream()
-        users = []
-
-        for user in users_ref:
-            user_data = user.to_dict()
-            user_data["id"] = user.id  # Include document ID
-            users.append(user_data)
-
-        return {"users": users}
+        # Page through recruiters by document ID, including the ID with each user
+        return fetch_page(
+            db.collection("recruiters"), limit, cursor,
+            lambda user: {**user.to_dict(), "id": user.id},
+        )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Entry point to run the FastAPI app
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the app as an import string; "auto" picks uvloop/httptools when installed
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("auth_app:app", host="0.0.0.0", port=8000, workers=workers, loop="auto", http="auto")
@@ -0,0 +1,32 @@
+# One-off migration: adds the derived search/filter fields to candidates written before
+# they existed. /candidates/search/ and /candidates/filter/ only see documents that have
+# them, so run this once after deploying, alongside `firebase deploy --only firestore:indexes`
+# for firestore.indexes.json:
+#
+#     python backfill_candidates.py
+from candidates_app import INDEX_FIELDS, BATCH_SIZE, add_index_fields
+from firebase_client import db
+
+
+def backfill_candidates():
+    batch, pending, updated = db.batch(), 0, 0
+    for candidate in db.collection("candidates").stream():
+        candidate_data = candidate.to_dict()
+        # Only write the derived fields so concurrent edits to other fields are kept
+        index_fields = {field: add_index_fields(dict(candidate_data))[field] for field in INDEX_FIELDS}
+        if all(candidate_data.get(field) == value for field, value in index_fields.items()):
+            continue
+        batch.update(candidate.reference, index_fields)
+        pending += 1
+        if pending == BATCH_SIZE:
+            batch.commit()
+            updated += pending
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+        updated += pending
+    return updated
+
+
+if __name__ == "__main__":
+    print(f"Backfilled {backfill_candidates()} candidates.")
@@ -1,16 +1,13 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from firebase_admin import credentials, firestore, initialize_app
+from pydantic import BaseModel, ConfigDict
+from firebase_client import db, fetch_page
+from google.api_core.exceptions import NotFound
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional, Dict, Any
 import os
 from dotenv import load_dotenv
 load_dotenv()
-# Initialize Firebase
-cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH"))
-initialize_app(cred)
-db = firestore.client()
 
 app = FastAPI()
 
@@ -25,6 +22,8 @@ app.add_middleware(
 
 # Pydantic model
 class Biding(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     role: str
     location: str
     ctc: float
@@ -35,39 +34,43 @@ class Biding(BaseModel):
 # Create Biding
 @app.post("/biding/", response_model=dict)
 def create_biding(biding: Biding):
-    doc_ref = db.collection("biding").add(biding.dict())
+    doc_ref = db.collection("biding").add(biding.model_dump())
     return {"id": doc_ref[1].id, "message": "Biding created successfully"}
 
 # Update Biding
 @app.put("/biding/{biding_id}", response_model=dict)
 def update_biding(biding_id: str, biding: Biding):
     doc_ref = db.collection("biding").document(biding_id)
-    if not doc_ref.get().exists:
+    # update() requires the document to exist and raises NotFound otherwise
+    try:
+        doc_ref.update(biding.model_dump())
+    except NotFound:
         raise HTTPException(status_code=404, detail="Biding not found")
-    doc_ref.update(biding.dict())
     return {"message": "Biding updated successfully"}
 
 # Delete Biding
 @app.delete("/biding/{biding_id}", response_model=dict)
 def delete_biding(biding_id: str):
     doc_ref = db.collection("biding").document(biding_id)
-    if not doc_ref.get().exists:
+    # Exists precondition makes delete() raise NotFound instead of a separate get()
+    try:
+        doc_ref.delete(option=db.write_option(exists=True))
+    except NotFound:
         raise HTTPException(status_code=404, detail="Biding not found")
-    doc_ref.delete()
     return {"message": "Biding deleted successfully"}
 
-# List all Biding with match_find=False
-@app.get("/biding/", response_model=Dict[str, List[Dict[str, Any]]])
-def list_bidings():
+# List Biding with match_find=False, one page at a time
+@app.get("/biding/", response_model=Dict[str, Any])
+def list_bidings(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
     try:
-        biding_docs = db.collection("biding").where("match_find", "==", False).stream()
-        bidings = [{"id": doc.id, **doc.to_dict()} for doc in biding_docs]
-
-        return {"bidings": bidings}  # Correct structure
+        query = db.collection("biding").where("match_find", "==", False)
+        return fetch_page(query, limit, cursor, lambda doc: {"id": doc.id, **doc.to_dict()})
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
     
 # Run the FastAPI app
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Workers need the app as an import string; "auto" picks uvloop/httptools when installed
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("biding_app:app", host="0.0.0.0", port=8000, workers=workers, loop="auto", http="auto")
\ No newline at end of file
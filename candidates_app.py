@@ -1,16 +1,19 @@
 from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel
-from firebase_admin import credentials, firestore, initialize_app
+from pydantic import BaseModel, ConfigDict
+from firebase_admin import firestore
+from firebase_client import db, run_in_fs_pool, fetch_page
+from google.cloud.firestore import ArrayUnion, ArrayRemove, Increment
+from google.api_core.exceptions import NotFound, AlreadyExists, Aborted, DeadlineExceeded
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import asyncio
+import time
 import os 
 from dotenv import load_dotenv
 load_dotenv()
 
-# Firebase setup
-cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH"))  # Path to your service account key
-initialize_app(cred)
-db = firestore.client()
 app = FastAPI()
 
 # Configure CORS middleware
@@ -24,6 +27,8 @@ app.add_middleware(
 
 # Pydantic model to represent candidate data, including created_by
 class Candidate(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     name: str
     location: str
     ctc: float
@@ -37,9 +42,95 @@ class Candidate(BaseModel):
     created_by: str  # Added field for creator's id
     candidate_id: Optional[str] = None  # Added field for candidate ID (document ID)
 
+# Fields whose words are indexed for keyword search
+SEARCH_FIELDS = ["name", "location", "role", "notice_period", "email", "contact", "linkedin"]
+
+# Helper function to split text into lowercased search words
+def search_words(text: str):
+    return [word.lower() for word in str(text).split()]
+
+# Helper function to build the lowercased keyword tokens stored on each candidate
+def build_search_tokens(candidate_dict: dict):
+    values = [candidate_dict[field] for field in SEARCH_FIELDS if candidate_dict.get(field) is not None]
+    # Skills are split into words too, so "machine" matches "Machine Learning"
+    values += candidate_dict.get("skills") or []
+    # Sorted so the stored list is identical across processes (set order varies with hash seed)
+    return sorted({word for value in values for word in search_words(value)})
+
+# Derived fields that searches and filters query on; documents written before these
+# existed are filled in by backfill_candidates.py
+INDEX_FIELDS = ["search_tokens", "location_lower", "role_lower", "notice_period_lower", "skills_lower"]
+
+# Helper function to add the derived fields that searches and filters query on
+def add_index_fields(candidate_dict: dict):
+    candidate_dict["search_tokens"] = build_search_tokens(candidate_dict)
+    # Lowercased copies so equality filters are case-insensitive
+    candidate_dict["location_lower"] = (candidate_dict.get("location") or "").lower()
+    candidate_dict["role_lower"] = (candidate_dict.get("role") or "").lower()
+    candidate_dict["notice_period_lower"] = (candidate_dict.get("notice_period") or "").lower()
+    candidate_dict["skills_lower"] = [skill.lower() for skill in candidate_dict.get("skills") or []]
+    return candidate_dict
+
+# Firestore rejects commits with more than 500 writes
+BATCH_SIZE = 500
+BATCH_MAX_RETRIES = 5
+# Thread pool for committing bulk-write chunks in parallel
+batch_pool = ThreadPoolExecutor(max_workers=10)
+
+# Helper function to bump a recruiter's num_candidates_listed counter as part of a batch;
+# update() fails the whole commit with NotFound if the recruiter does not exist
+def count_listed(batch, recruiter_id: str, delta: int):
+    recruiter_ref = db.collection("recruiters").document(recruiter_id)
+    batch.update(recruiter_ref, {"num_candidates_listed": Increment(delta)})
+
+# Helper function to ensure every given recruiter exists, with a single multi-document read
+def check_recruiters_exist(recruiter_ids):
+    refs = [db.collection("recruiters").document(recruiter_id) for recruiter_id in set(recruiter_ids)]
+    missing = [doc.id for doc in db.get_all(refs) if not doc.exists]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Recruiter not found: {', '.join(sorted(missing))}")
+
+# Helper function to split candidate writes into chunks that, together with one counter
+# update per recruiter, stay within Firestore's write limit
+def chunk_writes(writes):
+    chunks, chunk, counts = [], [], Counter()
+    for doc_ref, data in writes:
+        new_recruiter = data["created_by"] not in counts
+        if len(chunk) + len(counts) + 1 + new_recruiter > BATCH_SIZE:
+            chunks.append((chunk, counts))
+            chunk, counts = [], Counter()
+        chunk.append((doc_ref, data))
+        counts[data["created_by"]] += 1
+    if chunk:
+        chunks.append((chunk, counts))
+    return chunks
+
+# Helper function to commit one chunk of (doc_ref, data) creates and its recruiter
+# counter updates, retrying transient failures
+def commit_chunk(writes, counts):
+    for attempt in range(BATCH_MAX_RETRIES):
+        batch = db.batch()
+        for doc_ref, data in writes:
+            batch.create(doc_ref, data)
+        for recruiter_id, count in counts.items():
+            count_listed(batch, recruiter_id, count)
+        try:
+            return batch.commit()
+        except AlreadyExists:
+            # IDs are pre-generated, so on a retry this means an earlier attempt
+            # committed the whole chunk (and its counters) before timing out
+            if attempt == 0:
+                raise
+            return None
+        except (Aborted, DeadlineExceeded):
+            if attempt == BATCH_MAX_RETRIES - 1:
+                raise
+            time.sleep(0.1 * 2 ** attempt)  # Exponential backoff
+
 # Helper function to save candidate to Firestore
 def save_candidate(candidate: Candidate):
-    candidate_dict = candidate.dict()
+    candidate_dict = candidate.model_dump()
+    add_index_fields(candidate_dict)
     # Initialize empty bookmarks array if it doesn't exist
     candidate_dict['bookmarks'] = []
     candidate_dict['profile_seen_count'] = 0
@@ -47,16 +138,56 @@ def save_candidate(candidate: Candidate):
     # Create a new document in Firestore and get its document ID
     doc_ref = db.collection("candidates").document()
     candidate_dict["candidate_id"] = doc_ref.id  # Assign the document ID as candidate_id
-    doc_ref.set(candidate_dict)  # Save the candidate
+
+    # Save the candidate and bump the creator's listing counter in one commit
+    batch = db.batch()
+    batch.create(doc_ref, candidate_dict)
+    count_listed(batch, candidate.created_by, 1)
+    batch.commit()
     return doc_ref.id
 
+# Helper function to delete a candidate and decrement its creator's listing counter atomically
+@firestore.transactional
+def delete_candidate_doc(transaction, candidate_ref):
+    candidate = candidate_ref.get(transaction=transaction)
+    if not candidate.exists:
+        raise NotFound("Candidate not found")
+    created_by = candidate.to_dict().get("created_by")
+    # Only decrement a recruiter that still exists; all reads come before the writes
+    if created_by and db.collection("recruiters").document(created_by).get(transaction=transaction).exists:
+        count_listed(transaction, created_by, -1)
+    transaction.delete(candidate_ref)
+
+# Helper function to update a candidate, moving its listing count when created_by changes
+@firestore.transactional
+def update_candidate_doc(transaction, candidate_ref, candidate_dict):
+    candidate = candidate_ref.get(transaction=transaction)
+    if not candidate.exists:
+        raise NotFound("Candidate not found")
+    previous_owner = candidate.to_dict().get("created_by")
+    new_owner = candidate_dict["created_by"]
+    if previous_owner != new_owner:
+        if not db.collection("recruiters").document(new_owner).get(transaction=transaction).exists:
+            raise HTTPException(status_code=404, detail="Recruiter not found")
+        previous_exists = (
+            previous_owner is not None
+            and db.collection("recruiters").document(previous_owner).get(transaction=transaction).exists
+        )
+        count_listed(transaction, new_owner, 1)
+        if previous_exists:
+            count_listed(transaction, previous_owner, -1)
+    transaction.update(candidate_ref, candidate_dict)
+
 # Endpoint to create a new candidate
 @app.post("/candidates/")
 async def create_candidate(candidate: Candidate):
     try:
         # Pass the creator's email and save the candidate
-        candidate_id = save_candidate(candidate)
+        candidate_id = await run_in_fs_pool(save_candidate, candidate)
         return {"message": "Candidate created successfully", "candidate_id": candidate_id}
+    except NotFound:
+        # The only update in the commit is the creator's listing counter
+        raise HTTPException(status_code=404, detail="Recruiter not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -64,28 +195,43 @@ async def create_candidate(candidate: Candidate):
 @app.post("/candidates/bulk/")
 async def bulk_create_candidates(candidates: List[Candidate]):
     try:
-        batch = db.batch()
+        candidates_ref = db.collection("candidates")
+        writes = []
         for candidate in candidates:
             # Pass the creator's email and save each candidate in bulk
-            doc_ref = db.collection("candidates").document()
-            candidate_dict = candidate.dict()
+            # document() allocates the ID client-side, so a retried chunk writes the same documents
+            doc_ref = candidates_ref.document()
+            candidate_dict = candidate.model_dump()
             candidate_dict["candidate_id"] = doc_ref.id  # Assign document ID as candidate_id
             candidate_dict["bookmarks"] = []
-            batch.set(doc_ref, candidate_dict)
+            add_index_fields(candidate_dict)
+            writes.append((doc_ref, candidate_dict))
         
-        batch.commit()  # Commit all the bulk operations at once
+        # Fail before writing anything if a creator has no recruiter profile
+        await run_in_fs_pool(check_recruiters_exist, [candidate.created_by for candidate in candidates])
+
+        # Split into batches within Firestore's write limit and commit them in parallel
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(batch_pool, commit_chunk, chunk, counts)
+            for chunk, counts in chunk_writes(writes)
+        ))
         return {"message": f"{len(candidates)} candidates created successfully."}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 # Endpoint to get all candidates
 @app.get("/candidates/")
-async def get_all_candidates():
+async def get_all_candidates(limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
     try:
-        candidates_ref = db.collection("candidates").stream()
-        candidates = [candidate.to_dict() for candidate in candidates_ref]
-        return {"candidates": candidates}
+        # Page through candidates by document ID (same as candidate_id)
+        return await run_in_fs_pool(
+            fetch_page, db.collection("candidates"), limit, cursor,
+            lambda candidate: candidate.to_dict(),
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -93,15 +239,23 @@ async def get_all_candidates():
 @app.get("/candidates/search/")
 async def search_candidates(keyword: str):
     try:
-        candidates_ref = db.collection("candidates").stream()
-        matched_candidates = []
-        
-        for candidate in candidates_ref:
-            candidate_data = candidate.to_dict()
-            if any(keyword.lower() in str(value).lower() for value in candidate_data.values()):
-                matched_candidates.append(candidate_data)
+        words = search_words(keyword)
+        if not words:
+            return []
+
+        # Firestore matches the first word against the indexed search_tokens so only
+        # candidates containing it are read; any remaining words are checked here
+        query = db.collection("candidates").where("search_tokens", "array_contains", words[0])
+        remaining_words = set(words[1:])
 
-        return matched_candidates
+        def collect():
+            candidates = (candidate.to_dict() for candidate in query.stream())
+            return [
+                candidate_data for candidate_data in candidates
+                if remaining_words.issubset(candidate_data.get("search_tokens", []))
+            ]
+
+        return await run_in_fs_pool(collect)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -116,22 +270,37 @@ async def filter_candidates(
     skills: Optional[List[str]] = Query(None),
 ):
     try:
-        candidates_ref = db.collection("candidates").stream()
-        filtered_candidates = []
-
-        for candidate in candidates_ref:
-            candidate_data = candidate.to_dict()
-            if (
-                (location is None or candidate_data.get("location", "").lower() == location.lower()) and
-                (ctc is None or candidate_data.get("ctc", float("inf")) <= ctc) and
-                (role is None or candidate_data.get("role", "").lower() == role.lower()) and
-                (experience is None or candidate_data.get("experience", 0) >= experience) and
-                (notice_period is None or candidate_data.get("notice_period", "").lower() == notice_period.lower()) and
-                (skills is None or ("skills" in candidate_data and all(skill.lower() in [s.lower() for s in candidate_data["skills"]] for skill in skills)))
-            ):
-                filtered_candidates.append(candidate_data)
-
-        return filtered_candidates
+        # Push equality, range and array filters down to Firestore (see firestore.indexes.json)
+        query = db.collection("candidates")
+        if location is not None:
+            query = query.where("location_lower", "==", location.lower())
+        if role is not None:
+            query = query.where("role_lower", "==", role.lower())
+        if notice_period is not None:
+            query = query.where("notice_period_lower", "==", notice_period.lower())
+        if ctc is not None:
+            query = query.where("ctc", "<=", ctc)
+        if skills:
+            # Every requested skill is required, so any one of them narrows the result set
+            query = query.where("skills_lower", "array_contains", skills[0].lower())
+
+        # Lowercase the requested skills once, not per candidate
+        wanted_skills = {skill.lower() for skill in skills or []}
+
+        def collect():
+            filtered_candidates = []
+            for candidate in query.stream():
+                candidate_data = candidate.to_dict()
+                # Firestore allows a single range field and a single array filter per query
+                if (
+                    (experience is None or candidate_data.get("experience", 0) >= experience) and
+                    wanted_skills.issubset(candidate_data.get("skills_lower", []))
+                ):
+                    filtered_candidates.append(candidate_data)
+            return filtered_candidates
+
+        # Stream and filter in the Firestore pool so the event loop stays free
+        return await run_in_fs_pool(collect)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -142,28 +311,16 @@ async def bookmark_candidate(candidate_id: str, recruiter_id: str):
         candidate_ref = db.collection("candidates").document(candidate_id)
         recruiter_ref = db.collection("recruiters").document(recruiter_id)
         
-        candidate = candidate_ref.get()
-        recruiter = recruiter_ref.get()
-        
-        if not candidate.exists:
-            raise HTTPException(status_code=404, detail="Candidate not found")
-        
-        candidate_data = candidate.to_dict()
-        if recruiter_id not in candidate_data["bookmarks"]:
-            candidate_data["bookmarks"].append(recruiter_id)
-            candidate_ref.update({"bookmarks": candidate_data["bookmarks"]})
-        
-        if recruiter.exists:
-            recruiter_data = recruiter.to_dict()
-            if "bookmarked_candidates" not in recruiter_data:
-                recruiter_data["bookmarked_candidates"] = []
-            if candidate_id not in recruiter_data["bookmarked_candidates"]:
-                recruiter_data["bookmarked_candidates"].append(candidate_id)
-                recruiter_ref.update({"bookmarked_candidates": recruiter_data["bookmarked_candidates"]})
-        else:
-            recruiter_ref.set({"bookmarked_candidates": [candidate_id]})
+        # Both sides are updated atomically in one commit; update() fails with NotFound
+        # if the candidate does not exist, so no read is needed up front
+        batch = db.batch()
+        batch.update(candidate_ref, {"bookmarks": ArrayUnion([recruiter_id])})
+        batch.set(recruiter_ref, {"bookmarked_candidates": ArrayUnion([candidate_id])}, merge=True)
+        await run_in_fs_pool(batch.commit)
         
         return {"message": "Candidate bookmarked successfully."}
+    except NotFound:
+        raise HTTPException(status_code=404, detail="Candidate not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -172,7 +329,7 @@ async def bookmark_candidate(candidate_id: str, recruiter_id: str):
 async def list_bookmarked_candidates(recruiter_id: str):
     try:
         recruiter_ref = db.collection("recruiters").document(recruiter_id)
-        recruiter = recruiter_ref.get()
+        recruiter = await run_in_fs_pool(recruiter_ref.get)
         
         if not recruiter.exists:
             return {"message": "No bookmarks found"}
@@ -183,12 +340,13 @@ async def list_bookmarked_candidates(recruiter_id: str):
         if not candidate_ids:
             return {"message": "No bookmarks found"}
         
-        candidates = []
-        for candidate_id in candidate_ids:
-            candidate_ref = db.collection("candidates").document(candidate_id)
-            candidate_doc = candidate_ref.get()
-            if candidate_doc.exists:
-                candidates.append(candidate_doc.to_dict())
+        # Fetch all bookmarked candidates in a single multi-document read
+        refs = [db.collection("candidates").document(candidate_id) for candidate_id in candidate_ids]
+        docs = await run_in_fs_pool(lambda: list(db.get_all(refs)))
+        found = {doc.id: doc.to_dict() for doc in docs if doc.exists}
+        
+        # get_all does not preserve request order, so restore the bookmark order
+        candidates = [found[candidate_id] for candidate_id in candidate_ids if candidate_id in found]
         
         return candidates
     except Exception as e:
@@ -201,24 +359,20 @@ async def remove_bookmark(candidate_id: str, recruiter_id: str):
         candidate_ref = db.collection("candidates").document(candidate_id)
         recruiter_ref = db.collection("recruiters").document(recruiter_id)
         
-        candidate = candidate_ref.get()
-        recruiter = recruiter_ref.get()
-        
-        if not candidate.exists:
-            raise HTTPException(status_code=404, detail="Candidate not found")
-        
-        candidate_data = candidate.to_dict()
-        if recruiter_id in candidate_data["bookmarks"]:
-            candidate_data["bookmarks"].remove(recruiter_id)
-            candidate_ref.update({"bookmarks": candidate_data["bookmarks"]})
-        
-        if recruiter.exists:
-            recruiter_data = recruiter.to_dict()
-            if "bookmarked_candidates" in recruiter_data and candidate_id in recruiter_data["bookmarked_candidates"]:
-                recruiter_data["bookmarked_candidates"].remove(candidate_id)
-                recruiter_ref.update({"bookmarked_candidates": recruiter_data["bookmarked_candidates"]})
+        # update() on both sides, so a missing recruiter fails the commit instead of
+        # creating a stub recruiter document
+        batch = db.batch()
+        batch.update(candidate_ref, {"bookmarks": ArrayRemove([recruiter_id])})
+        batch.update(recruiter_ref, {"bookmarked_candidates": ArrayRemove([candidate_id])})
+        await run_in_fs_pool(batch.commit)
         
         return {"message": "Bookmark removed successfully."}
+    except NotFound:
+        # Only on failure: look up which of the two documents is missing
+        recruiter = await run_in_fs_pool(recruiter_ref.get)
+        if not recruiter.exists:
+            raise HTTPException(status_code=404, detail="Recruiter not found")
+        raise HTTPException(status_code=404, detail="Candidate not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -227,13 +381,16 @@ async def remove_bookmark(candidate_id: str, recruiter_id: str):
 async def update_candidate(candidate_id: str, candidate: Candidate):
     try:
         candidate_ref = db.collection("candidates").document(candidate_id)
-        candidate_doc = candidate_ref.get()
+        candidate_dict = candidate.model_dump()
+        add_index_fields(candidate_dict)
 
-        if candidate_doc.exists:
-            candidate_ref.update(candidate.dict())
-            return {"message": "Candidate profile updated successfully."}
-        else:
-            raise HTTPException(status_code=404, detail="Candidate not found")
+        # Read inside a transaction so a created_by change moves the listing count too
+        await run_in_fs_pool(update_candidate_doc, db.transaction(), candidate_ref, candidate_dict)
+        return {"message": "Candidate profile updated successfully."}
+    except NotFound:
+        raise HTTPException(status_code=404, detail="Candidate not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -242,17 +399,18 @@ async def update_candidate(candidate_id: str, candidate: Candidate):
 async def delete_candidate(candidate_id: str):
     try:
         candidate_ref = db.collection("candidates").document(candidate_id)
-        candidate = candidate_ref.get()
 
-        if candidate.exists:
-            candidate_ref.delete()
-            return {"message": "Candidate deleted successfully"}
-        else:
-            raise HTTPException(status_code=404, detail="Candidate not found")
+        # The candidate is read inside the transaction to find whose counter to decrement
+        await run_in_fs_pool(delete_candidate_doc, db.transaction(), candidate_ref)
+        return {"message": "Candidate deleted successfully"}
+    except NotFound:
+        raise HTTPException(status_code=404, detail="Candidate not found")
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 # Run the application
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the app as an import string; "auto" picks uvloop/httptools when installed
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("candidates_app:app", host="0.0.0.0", port=8000, workers=workers, loop="auto", http="auto")
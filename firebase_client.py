@@ -0,0 +1,40 @@
+import firebase_admin
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+from firebase_admin import credentials, firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from typing import Optional
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+# Shared Firebase setup so every app in the process reuses one app and one Firestore client
+try:
+    firebase_admin.get_app()
+except ValueError:
+    # Path to your service account key (CRED_PATH kept for the transactions service)
+    cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH") or os.getenv("CRED_PATH"))
+    firebase_admin.initialize_app(cred)
+
+db = firestore.client()
+
+# Thread pool for blocking Firestore / Firebase Admin calls made from async endpoints
+FS_POOL = ThreadPoolExecutor(max_workers=32)
+
+# Helper function to read one page of a query ordered by document ID; cursor is the last
+# document ID of the previous page. Pages are bounded by limit, so they are built in memory
+# and any Firestore error is raised before a response is started
+def fetch_page(query, limit: int, cursor: Optional[str], to_item):
+    query = query.order_by(FieldPath.document_id()).limit(limit)
+    if cursor:
+        query = query.start_after({FieldPath.document_id(): cursor})
+    docs = list(query.stream())
+    # A full page means more documents may follow the last one
+    next_cursor = docs[-1].id if len(docs) == limit else None
+    return {"items": [to_item(doc) for doc in docs], "next_cursor": next_cursor}
+
+# Helper function to run a blocking Firebase call in FS_POOL without blocking the event loop
+async def run_in_fs_pool(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(FS_POOL, functools.partial(func, *args, **kwargs))
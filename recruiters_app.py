@@ -1,6 +1,5 @@
 from fastapi import FastAPI, HTTPException
-import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_client import db
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
@@ -9,13 +8,6 @@ load_dotenv()
 # Initialize FastAPI app
 app = FastAPI()
 
-# Load Firebase credentials from environment variable
-cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH"))
-firebase_admin.initialize_app(cred)
-
-# Initialize Firestore client
-db = firestore.client()
-
 # Enable CORS (Cross-Origin Resource Sharing)
 app.add_middleware(
     CORSMiddleware,
@@ -82,4 +74,6 @@ def get_recruiter_by_id(recruiter_id: str):
 # Run the FastAPI app
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the app as an import string; "auto" picks uvloop/httptools when installed
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("recruiters_app:app", host="0.0.0.0", port=8000, workers=workers, loop="auto", http="auto")
@@ -0,0 +1,42 @@
+import os
+import sys
+from unittest import mock
+
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.firestore import Client
+
+# The app modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def firebase_client():
+    """Import firebase_client against an offline Firestore client instead of real credentials."""
+    client = Client(project="test-project", credentials=AnonymousCredentials())
+    with mock.patch("firebase_admin.get_app", side_effect=ValueError), \
+            mock.patch("firebase_admin.credentials.Certificate"), \
+            mock.patch("firebase_admin.initialize_app"), \
+            mock.patch("firebase_admin.firestore.client", return_value=client):
+        sys.modules.pop("firebase_client", None)
+        import firebase_client
+        yield firebase_client
+    sys.modules.pop("firebase_client", None)
+
+
+@pytest.fixture
+def candidates_app(firebase_client):
+    """Import candidates_app wired to the offline firebase_client."""
+    sys.modules.pop("candidates_app", None)
+    import candidates_app
+    yield candidates_app
+    sys.modules.pop("candidates_app", None)
+
+
+@pytest.fixture
+def auth_app(firebase_client):
+    """Import auth_app wired to the offline firebase_client."""
+    sys.modules.pop("auth_app", None)
+    import auth_app
+    yield auth_app
+    sys.modules.pop("auth_app", None)
@@ -0,0 +1,23 @@
+from unittest import mock
+
+import pytest
+
+
+@pytest.mark.parametrize("token", [None, ""])
+def test_missing_token_is_rejected_by_admin_sdk(auth_app, token):
+    error = ValueError("Illegal ID token provided.")
+    with mock.patch.object(auth_app.auth, "verify_id_token", side_effect=error) as verify:
+        with pytest.raises(ValueError, match="Illegal ID token"):
+            auth_app.cached_verify_id_token(token, check_revoked=True)
+
+    verify.assert_called_once_with(token, check_revoked=True)
+    assert len(auth_app.token_cache) == 0
+
+
+def test_verified_token_is_served_from_cache(auth_app):
+    decoded = {"uid": "user-1", "exp": 2**31}
+    with mock.patch.object(auth_app.auth, "verify_id_token", return_value=decoded) as verify:
+        assert auth_app.cached_verify_id_token("token") is decoded
+        assert auth_app.cached_verify_id_token("token") is decoded
+
+    verify.assert_called_once_with("token", check_revoked=False)
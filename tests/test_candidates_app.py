@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+from google.cloud.firestore_v1.query import Query
+
+
+CANDIDATE = {
+    "name": "John Doe",
+    "location": "Pune",
+    "role": "ML Engineer",
+    "notice_period": "30 days",
+    "email": "john@example.com",
+    "contact": "12345",
+    "linkedin": None,
+    "skills": ["Machine Learning", "Python"],
+    "created_by": "recruiter-1",
+}
+
+
+def test_search_tokens_split_names_and_skills_into_words(candidates_app):
+    tokens = candidates_app.build_search_tokens(dict(CANDIDATE))
+
+    assert {"john", "doe", "machine", "learning", "python", "pune"} <= set(tokens)
+    assert "machine learning" not in tokens
+
+
+def test_search_matches_multi_word_keyword(candidates_app):
+    stored = [candidates_app.add_index_fields(dict(CANDIDATE)), candidates_app.add_index_fields(dict(CANDIDATE, name="John Smith"))]
+    docs = [SimpleNamespace(to_dict=lambda data=data: data) for data in stored]
+
+    with mock.patch.object(Query, "stream", autospec=True, return_value=iter(docs)) as stream:
+        matched = asyncio.run(candidates_app.search_candidates("John Doe"))
+
+    query_pb = stream.call_args.args[0]._to_protobuf()
+    assert query_pb.where.field_filter.value.string_value == "john"
+    assert [candidate["name"] for candidate in matched] == ["John Doe"]
+
+
+def test_search_with_blank_keyword_returns_nothing(candidates_app):
+    assert asyncio.run(candidates_app.search_candidates("   ")) == []
+
+
+def test_search_tokens_are_sorted(candidates_app):
+    # A fixed order keeps the stored list identical across processes and hash seeds,
+    # which backfill_candidates.py relies on to skip up-to-date documents
+    tokens = candidates_app.build_search_tokens(dict(CANDIDATE))
+    assert tokens == sorted(tokens)
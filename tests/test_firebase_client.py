@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from google.cloud.firestore_v1.query import Query
+
+
+def fake_doc(doc_id):
+    return SimpleNamespace(id=doc_id, to_dict=lambda: {"name": doc_id})
+
+
+def run_fetch_page(firebase_client, docs, limit, cursor):
+    query = firebase_client.db.collection("biding").where("match_find", "==", False)
+    with mock.patch.object(Query, "stream", autospec=True, return_value=iter(docs)) as stream:
+        page = firebase_client.fetch_page(query, limit, cursor, lambda doc: {"id": doc.id, **doc.to_dict()})
+    built_query = stream.call_args.args[0]
+    return page, built_query._to_protobuf()
+
+
+def test_fetch_page_orders_by_document_id_and_limits(firebase_client):
+    page, query_pb = run_fetch_page(firebase_client, [fake_doc("a"), fake_doc("b")], 2, None)
+
+    assert query_pb.order_by[0].field.field_path == "__name__"
+    assert query_pb.limit == 2
+    assert not query_pb.start_at.values
+    assert page == {"items": [{"id": "a", "name": "a"}, {"id": "b", "name": "b"}], "next_cursor": "b"}
+
+
+def test_fetch_page_starts_after_cursor_document(firebase_client):
+    page, query_pb = run_fetch_page(firebase_client, [fake_doc("d")], 2, "c")
+
+    cursor_value = query_pb.start_at.values[0]
+    assert cursor_value.reference_value.endswith("/documents/biding/c")
+    assert not query_pb.start_at.before
+    # A short page has no next cursor
+    assert page == {"items": [{"id": "d", "name": "d"}], "next_cursor": None}
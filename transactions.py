@@ -1,18 +1,15 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from firebase_admin import credentials, firestore, initialize_app
+from fastapi import FastAPI, HTTPException, Query
+from pydantic import BaseModel, ConfigDict
+from firebase_admin import firestore
+from firebase_client import db, run_in_fs_pool, fetch_page
+from google.api_core.exceptions import NotFound
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
+from typing import Optional
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Firebase Setup
-cred = credentials.Certificate(os.getenv("CRED_PATH"))
-initialize_app(cred)
-db = firestore.client()
-
 app = FastAPI()
 
 # CORS middleware
@@ -26,6 +23,8 @@ app.add_middleware(
 
 # Pydantic Model for Connects Input
 class ConnectInput(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     user_id: str
     connects: int
     transaction_type: str  # ["buy", "use", "add"]
@@ -37,55 +36,88 @@ def calculate_amount(connects: int):
     return connects * price_per_connect
 
 
-### ✅ 1. Handle Connect Transactions (Add/Use/Buy)
-@app.post("/connects/")
-async def manage_connects(data: ConnectInput):
-    # Fetch the recruiter document
-    recruiter_ref = db.collection("recruiters").document(data.user_id)
-    recruiter = recruiter_ref.get()
+### ✅ Helper Function to Read the Balance Returned by an Increment in a Commit Response
+def incremented_balance(write_result):
+    for value in write_result.transform_results:
+        # updated_at's SERVER_TIMESTAMP also has a transform result; skip non-numeric ones
+        kind = type(value).pb(value).WhichOneof("value_type")
+        if kind in ("integer_value", "double_value"):
+            return getattr(value, kind)
+    return None
+
+
+### ✅ Helper Function to Use Connects Inside a Firestore Transaction
+@firestore.transactional
+def use_connects(transaction, recruiter_ref, transaction_ref, record):
+    # Read the balance inside the transaction so concurrent uses cannot both spend it
+    recruiter = recruiter_ref.get(transaction=transaction)
 
     # If recruiter does not exist
     if not recruiter.exists:
         raise HTTPException(status_code=404, detail="Recruiter not found")
 
-    # Get current connects of the recruiter
-    recruiter_data = recruiter.to_dict()
-    current_connects = recruiter_data.get("connects", 0)
+    current_connects = recruiter.to_dict().get("connects", 0)
+    if record["connects"] > current_connects:
+        raise HTTPException(status_code=400, detail="Insufficient connects")
+    new_connects = current_connects - record["connects"]
+
+    transaction.update(recruiter_ref, {
+        "connects": new_connects,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    })
+    transaction.set(transaction_ref, record)
+    return new_connects
+
+
+### ✅ 1. Handle Connect Transactions (Add/Use/Buy)
+@app.post("/connects/")
+async def manage_connects(data: ConnectInput):
+    recruiter_ref = db.collection("recruiters").document(data.user_id)
 
     # Handle Transaction Types
     if data.transaction_type.lower() == "buy":
-        # Add connects for buy
-        new_connects = current_connects + data.connects
         transaction_type = "Buy"
     elif data.transaction_type.lower() == "add":
         # Add free connects (like bonus or admin gift)
-        new_connects = current_connects + data.connects
         transaction_type = "Add"
     elif data.transaction_type.lower() == "use":
-        # Use connects
-        if data.connects > current_connects:
-            raise HTTPException(status_code=400, detail="Insufficient connects")
-        new_connects = current_connects - data.connects
         transaction_type = "Use"
     else:
         raise HTTPException(status_code=400, detail="Invalid transaction type. Use 'buy', 'add', or 'use'.")
 
-    # ✅ Step 1: Update Recruiter Profile with New Connects
-    recruiter_ref.update({
-        "connects": new_connects,
-        "updated_at": datetime.utcnow()
-    })
-
-    # ✅ Step 2: Add Transaction Record in `connects_transaction`
+    # Transaction Record for `connects_transaction`
     amount = calculate_amount(data.connects) if transaction_type == "Buy" else 0
     transaction_ref = db.collection("connects_transaction").document()
-    transaction_ref.set({
+    record = {
         "user_id": data.user_id,
         "connects": data.connects,
         "amount": amount,
         "transaction_type": transaction_type,
-        "timestamp": datetime.utcnow()
-    })
+        "timestamp": firestore.SERVER_TIMESTAMP
+    }
+
+    if transaction_type == "Use":
+        # Use connects: balance check and write commit together in a transaction
+        new_connects = await run_in_fs_pool(use_connects, db.transaction(), recruiter_ref, transaction_ref, record)
+    else:
+        # Buy/Add need no balance check, so increment server-side without reading first;
+        # the balance update and its transaction record still commit atomically
+        batch = db.batch()
+        batch.update(recruiter_ref, {
+            "connects": firestore.Increment(data.connects),
+            "updated_at": firestore.SERVER_TIMESTAMP
+        })
+        batch.set(transaction_ref, record)
+        try:
+            write_results = await run_in_fs_pool(batch.commit)
+        except NotFound:
+            raise HTTPException(status_code=404, detail="Recruiter not found")
+
+        # The commit response carries the incremented balance; read it back if it does not
+        new_connects = incremented_balance(write_results[0])
+        if new_connects is None:
+            recruiter = await run_in_fs_pool(recruiter_ref.get)
+            new_connects = recruiter.to_dict().get("connects", 0)
 
     return {
         "message": f"{transaction_type} completed successfully.",
@@ -98,7 +130,7 @@ async def manage_connects(data: ConnectInput):
 async def get_connects_summary(user_id: str):
     # Get Recruiter Profile
     recruiter_ref = db.collection("recruiters").document(user_id)
-    recruiter = recruiter_ref.get()
+    recruiter = await run_in_fs_pool(recruiter_ref.get)
 
     if not recruiter.exists:
         raise HTTPException(status_code=404, detail="Recruiter not found")
@@ -112,18 +144,16 @@ async def get_connects_summary(user_id: str):
 
 ### ✅ 3. Get All Connect Transactions for User
 @app.get("/transactions/{user_id}")
-async def get_all_transactions(user_id: str):
-    transactions = db.collection("connects_transaction").where("user_id", "==", user_id).stream()
-
-    data = []
-    for transaction in transactions:
-        data.append({
-            "id": transaction.id,
-            **transaction.to_dict()
-        })
-    return data
+async def get_all_transactions(user_id: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    query = db.collection("connects_transaction").where("user_id", "==", user_id)
+    return await run_in_fs_pool(
+        fetch_page, query, limit, cursor,
+        lambda transaction: {"id": transaction.id, **transaction.to_dict()},
+    )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Workers need the app as an import string; "auto" picks uvloop/httptools when installed
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    uvicorn.run("transactions:app", host="0.0.0.0", port=8000, workers=workers, loop="auto", http="auto")
 